@@ -1,3 +1,7 @@
+import ast
+import collections
+import json
+
 from datetime import datetime
 
 from ._vendor.six import string_types
@@ -15,15 +19,64 @@ def match_types(a, b):
         return a, b
 
 
-def And(filters):
-    def _And(entity):
-        return all(f(entity) for f in filters)
-    return _And
+class And(object):
+
+    __slots__ = ('children',)
+
+    op = ast.And
+    empty = True
+    const_value = None
+
+    def __init__(self, filters):
+        self.children = list(filters)
+
+    def __call__(self, entity):
+        # An explicit loop over a local; all() over a generator expression
+        # costs an extra frame per call.
+        for f in self.children:
+            if not f(entity):
+                return False
+        return True
+
+    # Groups are as expensive as their worst child.
+    @property
+    def cost(self):
+        return max((c.cost for c in self.children), default=1)
+
+    @property
+    def selectivity(self):
+        return max((c.selectivity for c in self.children), default=1)
+
+
+class Or(And):
+
+    __slots__ = ()
+
+    op = ast.Or
+    empty = False
+
+    def __call__(self, entity):
+        for f in self.children:
+            if f(entity):
+                return True
+        return False
+
+
+class _Constant(object):
+
+    """A predicate whose outcome is known at compile time."""
+
+    cost = 0
+    selectivity = 0
+
+    def __init__(self, value):
+        self.const_value = value
+
+    def __call__(self, entity):
+        return self.const_value
 
-def Or(filters):
-    def _Or(entity):
-        return any(f(entity) for f in filters)
-    return _Or
+    def ast_expr(self, consts):
+        return ast.Constant(value=self.const_value)
 
 
 
@@ -56,7 +109,67 @@ def _compile_filters(filters):
     else:
         raise ValueError("Invalid filter_operator {}".format(op))
 
-    return op_cls([_compile_condition(f) for f in conditions])
+    # Run cheap/selective predicates first so the later, pricier ones are
+    # short-circuited away on most rows. ``Or`` wants likely-true children
+    # first, so it sorts the other way. Predicates are side-effect free, so
+    # reordering cannot change the result.
+    children = []
+    for child in (_compile_condition(f) for f in conditions):
+        # Splice same-operator subgroups into us; `a and (b and c)` is the
+        # same as `a and b and c`, and one flat n-ary operator saves an
+        # interpreter trip per level per row.
+        if type(child) is op_cls:
+            children.extend(child.children)
+        else:
+            children.append(child)
+    children = _fold_constants(op_cls, children)
+    # The common case is a single condition, which needs no wrapper at
+    # all; `[('code', 'is', ...)]` then compiles to the bare predicate.
+    if len(children) == 1:
+        return children[0]
+    children.sort(key=lambda c: (c.cost, c.selectivity), reverse=(op_cls is Or))
+    return op_cls(children)
+
+
+def _fold_constants(op_cls, children):
+    """Drop or collapse predicates whose outcome is known at compile time."""
+
+    short = not op_cls.empty
+    folded = []
+    is_values = set()
+    is_not_values = set()
+    for child in children:
+
+        # An `in` on exactly one plain value is just an `is`.
+        if type(child) is InFilter and len(child.values) == 1:
+            value = next(iter(child.values))
+            if not isinstance(value, (dict, datetime) + string_types):
+                child = IsFilter(child.field, value)
+
+        # Track contradicting is/is_not pairs on the same field under And.
+        if op_cls is And:
+            pair = None
+            if type(child) is IsFilter:
+                pair, seen, other = (child.field, child.value), is_values, is_not_values
+            elif isinstance(getattr(child, 'filter', None), IsFilter):
+                pair, seen, other = (child.filter.field, child.filter.value), is_not_values, is_values
+            try:
+                if pair is not None:
+                    if pair in other:
+                        return [_Constant(False)]
+                    seen.add(pair)
+            except TypeError:
+                # Unhashable value (e.g. an entity dict); can't track it.
+                pass
+
+        const = child.const_value
+        if const is None:
+            folded.append(child)
+        elif const is short:
+            return [_Constant(short)]
+        # Identity constants (true under And, false under Or) just drop out.
+
+    return folded
 
 
 def _compile_condition(condition):
@@ -82,11 +195,127 @@ def _compile_condition(condition):
     return op_cls(field, *values)
 
 
-def filter_entities(filters, entities):
-    compiled = _compile_filters(filters)
+# AST construction helpers for the compiled predicate. The predicate is a
+# single ``lambda e: ...`` whose free variable ``K`` is a tuple of constants
+# (values, frozensets, or fallback filter callables) bound at compile time.
+
+def _ast_const(consts, value):
+    consts.append(value)
+    return ast.Subscript(
+        value=ast.Name(id='K', ctx=ast.Load()),
+        slice=ast.Constant(value=len(consts) - 1),
+        ctx=ast.Load(),
+    )
+
+def _ast_get(field):
+    return ast.Call(
+        func=ast.Attribute(
+            value=ast.Name(id='e', ctx=ast.Load()),
+            attr='get',
+            ctx=ast.Load(),
+        ),
+        args=[ast.Constant(value=field)],
+        keywords=[],
+    )
+
+def _build_ast(node, consts):
+    if isinstance(node, And):
+        if not node.children:
+            return ast.Constant(value=node.empty)
+        values = [_build_ast(child, consts) for child in node.children]
+        if len(values) == 1:
+            return values[0]
+        return ast.BoolOp(op=node.op(), values=values)
+    return node.ast_expr(consts)
+
+
+def _compile_predicate(filters, node=None):
+    """Compile a filter spec into a single Python function of one entity.
+
+    Rather than a tree of closures invoked once per predicate per entity,
+    we fold the whole filter into one ``BoolOp`` expression (which already
+    short-circuits) and ``compile()`` it, so each entity pays for a single
+    call frame no matter how many conditions there are.
+
+    """
+    if node is None:
+        node = _compile_filters(filters)
+    consts = []
+    body = _build_ast(node, consts)
+    expr = ast.Expression(body=ast.Lambda(
+        args=ast.arguments(
+            posonlyargs=[], args=[ast.arg(arg='e')],
+            kwonlyargs=[], kw_defaults=[], defaults=[],
+        ),
+        body=body,
+    ))
+    ast.fix_missing_locations(expr)
+    code = compile(expr, '<filter>', 'eval')
+    return eval(code, {'K': tuple(consts)})
+
+
+_predicate_cache = collections.OrderedDict()
+_predicate_cache_maxsize = 256
+
+
+def _cache_key_default(value):
+    # Prefix with the type so e.g. a datetime and its string form can't
+    # collide to the same key.
+    return '%s:%s' % (type(value).__name__, value)
+
+
+def compile_cached(filters):
+    """Compile a filter spec, memoizing on its JSON shape.
+
+    Returns a ``(node, compiled)`` pair: the folded condition tree (for
+    callers that want to inspect it, e.g. for index lookups) and the
+    compiled predicate. Callers tend to issue the same filter shape over
+    and over (e.g. the ``default_steps`` loop), so an LRU of compiled
+    predicates pays for the key serialization many times over.
+
+    """
+    try:
+        key = json.dumps(filters, sort_keys=True, default=_cache_key_default)
+    except (TypeError, ValueError):
+        node = _compile_filters(filters)
+        return node, _compile_predicate(filters, node)
+    try:
+        entry = _predicate_cache.pop(key)
+    except KeyError:
+        node = _compile_filters(filters)
+        entry = (node, _compile_predicate(filters, node))
+        if len(_predicate_cache) >= _predicate_cache_maxsize:
+            _predicate_cache.popitem(last=False)
+    _predicate_cache[key] = entry
+    return entry
+
+
+def filter_entities(filters, entities, compiled=None):
+    if compiled is None:
+        compiled = _compile_predicate(filters)
     return (e for e in entities if compiled(e))
 
 
+def filter_entities_take(filters, entities, n, compiled=None):
+    """Return a list of at most the first ``n`` matching entities.
+
+    Stops iterating as soon as ``n`` matches are found, so a
+    ``find_one``-style query doesn't evaluate the predicate over rows it
+    would discard anyway.
+
+    """
+    if compiled is None:
+        compiled = _compile_predicate(filters)
+    res = []
+    append = res.append
+    for e in entities:
+        if compiled(e):
+            append(e)
+            if len(res) >= n:
+                break
+    return res
+
+
 
 def NotWrap(cls):
     class _Not(object):
@@ -94,6 +323,18 @@ def NotWrap(cls):
             self.filter = cls(*args)
         def __call__(self, entity):
             return not self.filter(entity)
+        def ast_expr(self, consts):
+            return ast.UnaryOp(op=ast.Not(), operand=self.filter.ast_expr(consts))
+        @property
+        def cost(self):
+            return self.filter.cost
+        @property
+        def selectivity(self):
+            return self.filter.selectivity
+        @property
+        def const_value(self):
+            value = self.filter.const_value
+            return None if value is None else not value
     return _Not
 
 
@@ -108,14 +349,98 @@ def register(*names, **kwargs):
 
 class ScalarFilter(object):
 
+    # Rough per-row expense and how many rows are expected to survive;
+    # equality beats prefix beats range. Only relative order matters.
+    cost = 2
+    selectivity = 4
+    const_value = None
+
     def __init__(self, field, value):
         self.field = field
         self.value = value
+        # Our side of match_types is fixed, so pick the coercion once here
+        # instead of paying its two isinstance checks on every row.
+        if isinstance(value, datetime):
+            self._value_str = value.strftime('%Y-%m-%dT%H:%M:%SZ')
+            self._match = self._match_datetime_value
+        elif isinstance(value, string_types):
+            self._match = self._match_string_value
+        else:
+            self._match = self._match_plain
+
+    def _match_plain(self, other):
+        return self.value, other
+
+    def _match_datetime_value(self, other):
+        if isinstance(other, string_types):
+            return self._value_str, other
+        return self.value, other
+
+    def _match_string_value(self, other):
+        if isinstance(other, datetime):
+            return self.value, other.strftime('%Y-%m-%dT%H:%M:%SZ')
+        return self.value, other
 
     def __call__(self, entity):
-        value, other = match_types(self.value, entity.get(self.field))
+        value, other = self._match(entity.get(self.field))
         return self.test(value, other)
 
+    # Source template for :meth:`codegen`; `o` is the (coerced) row value
+    # and `_v` the filter value. None means the generic dispatch runs.
+    expr = None
+
+    def codegen(self):
+        """Generate a flat, monomorphic function for this predicate.
+
+        One exec'd function per instance replaces the ``__call__`` ->
+        ``_match`` -> ``test`` chain (three dispatches per row) with a
+        single plain-function call, with the coercion branch baked in for
+        this value's type.
+
+        """
+        ns = {
+            '_field': self.field,
+            '_v': self.value,
+            '_str': string_types,
+            '_dt': datetime,
+        }
+        if isinstance(self.value, datetime):
+            ns['_vs'] = self._value_str
+            src = (
+                'def _predicate(e):\n'
+                '    o = e.get(_field)\n'
+                '    if isinstance(o, _str):\n'
+                '        return %s\n'
+                '    return %s\n'
+            ) % (self.expr.replace('_v', '_vs'), self.expr)
+        elif isinstance(self.value, string_types):
+            src = (
+                'def _predicate(e):\n'
+                '    o = e.get(_field)\n'
+                '    if isinstance(o, _dt):\n'
+                '        o = o.strftime(\'%%Y-%%m-%%dT%%H:%%M:%%SZ\')\n'
+                '    return %s\n'
+            ) % self.expr
+        else:
+            src = (
+                'def _predicate(e):\n'
+                '    o = e.get(_field)\n'
+                '    return %s\n'
+            ) % self.expr
+        exec(src, ns)
+        return ns['_predicate']
+
+    def ast_expr(self, consts):
+        # Call a generated monomorphic function, or the filter itself when
+        # there is no template. The ``match_types`` coercion and subclass
+        # semantics are preserved either way.
+        fn = self.codegen() if self.expr else self
+        return ast.Call(
+            func=_ast_const(consts, fn),
+            args=[ast.Name(id='e', ctx=ast.Load())],
+            keywords=[],
+        )
+
     def test(self, value, field):
         raise NotImplementedError()
 
@@ -124,6 +449,9 @@ class ScalarFilter(object):
 @register('is_not', wrap=NotWrap)
 class IsFilter(ScalarFilter):
 
+    cost = 1
+    selectivity = 1
+
     def test(self, value, field):
         if isinstance(value, dict):
             return (
@@ -133,26 +461,67 @@ class IsFilter(ScalarFilter):
         else:
             return value == field
 
+    expr = '_v == o'
+
+    def ast_expr(self, consts):
+        # Entity values compare by type/id, which has no template; plain
+        # non-coercing values inline as a bare equality; datetime/string
+        # values take the generated-function path from the base class.
+        if isinstance(self.value, dict):
+            return ast.Call(
+                func=_ast_const(consts, self),
+                args=[ast.Name(id='e', ctx=ast.Load())],
+                keywords=[],
+            )
+        if isinstance(self.value, (datetime,) + string_types):
+            return super(IsFilter, self).ast_expr(consts)
+        return ast.Compare(
+            left=_ast_get(self.field),
+            ops=[ast.Eq()],
+            comparators=[_ast_const(consts, self.value)],
+        )
+
 
 @register('in')
 @register('not_in', wrap=NotWrap)
 class InFilter(object):
 
+    cost = 1
+    selectivity = 2
+
     def __init__(self, field, *values):
         self.field = field
-        self.values = set(values)
+        # A frozenset hashes (and so can sit in compiled constants), but
+        # for a handful of values a linear scan over a tuple beats the
+        # set-hash overhead.
+        values = frozenset(values)
+        self.values = values if len(values) > 4 else tuple(values)
+
+    @property
+    def const_value(self):
+        # Membership in the empty set can never match.
+        return False if not self.values else None
 
     def __call__(self, entity):
         return entity.get(self.field) in self.values
 
+    def ast_expr(self, consts):
+        return ast.Compare(
+            left=_ast_get(self.field),
+            ops=[ast.In()],
+            comparators=[_ast_const(consts, self.values)],
+        )
+
 
 @register('less_than')
 class LessThanFilter(ScalarFilter):
+    expr = 'o < _v'
     def test(self, value, field):
         return field < value
 
 @register('greater_than')
 class LessThanFilter(ScalarFilter):
+    expr = 'o > _v'
     def test(self, value, field):
         return field > value
 
@@ -160,6 +529,10 @@ class LessThanFilter(ScalarFilter):
 @register('starts_with')
 class StartsWithFilter(ScalarFilter):
 
+    cost = 3
+    selectivity = 3
+    expr = 'o.startswith(_v)'
+
     def test(self, value, field):
         return field.startswith(value)
 
@@ -167,5 +540,9 @@ class StartsWithFilter(ScalarFilter):
 @register('ends_with')
 class EndsWithFilter(ScalarFilter):
 
+    cost = 3
+    selectivity = 3
+    expr = 'o.endswith(_v)'
+
     def test(self, value, field):
         return field.endswith(value)
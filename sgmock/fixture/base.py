@@ -1,5 +1,16 @@
 _required = object()
 
+#: Maps entity type names to their fixture classes; filled in by
+#: :func:`_register_entity` as the classes are defined.
+_entity_types = {}
+
+
+def _register_entity(cls):
+    _entity_types[cls.__name__[1:]] = cls
+    cls._required_names = tuple(
+        name for name, default in cls._argument_defaults if default is _required)
+    return cls
+
 
 class Fixture(object):
     
@@ -71,11 +82,15 @@ class Fixture(object):
         """Delete all entities that this fixture created or proxied the creation of."""
         if not self.created:
             return
-        self.shotgun.batch([dict(
-            request_type='delete',
-            entity_type=type_,
-            entity_id=id_,
-        ) for type_, id_ in reversed(self.created)])
+        # Preallocate; we know exactly how many requests there will be.
+        requests = [None] * len(self.created)
+        for i, (type_, id_) in enumerate(reversed(self.created)):
+            requests[i] = dict(
+                request_type='delete',
+                entity_type=type_,
+                entity_id=id_,
+            )
+        self.shotgun.batch(requests)
         self.created = []
         
     def find_or_create(self, entity_type, data=None, **kwargs):
@@ -141,16 +156,32 @@ class _Creator(object):
         
     def __call__(self, *args, **kwargs):
         constructor = _entity_types.get(self.entity_type, _Entity)
-        for name, default in constructor._argument_defaults:
-            if name not in kwargs:
-                if not args:
-                    if default is _required:
-                        raise TypeError('%s missing required %s' % (self.entity_type, name))
-                    kwargs[name] = default
+
+        if not args:
+            # Fast path: no positionals to thread through, so just check
+            # the precomputed required names and fill in the defaults.
+            for name in constructor._required_names:
+                if name not in kwargs:
+                    raise TypeError('%s missing required %s' % (self.entity_type, name))
+            for name, default in constructor._argument_defaults:
+                kwargs.setdefault(name, default)
+        else:
+            # Consume positionals by index; slicing args each step copies
+            # the whole remainder every time.
+            ai = 0
+            nargs = len(args)
+            for name, default in constructor._argument_defaults:
+                if name in kwargs:
+                    continue
+                if ai < nargs:
+                    kwargs[name] = args[ai]
+                    ai += 1
+                elif default is _required:
+                    raise TypeError('%s missing required %s' % (self.entity_type, name))
                 else:
-                    kwargs[name] = args[0]
-                    args = args[1:]
-        
+                    kwargs[name] = default
+
+
         if self.parent:
             self.parent.prepare_child(self.entity_type, kwargs)
         raw = self.fixture.create(self.entity_type, kwargs, kwargs.keys())
@@ -160,20 +191,23 @@ class _Creator(object):
 class _Entity(dict):
     
     _argument_defaults = []
+    _required_names = ()
     _parent = None
     _backrefs = {}
     
     def prepare_child(self, entity_type, kwargs):
-        
+
         # Set backref to us.
         kwargs[self._backrefs[entity_type]] = self.minimal
-            
-        # Set the project.
-        if self['type'] == 'Project':
-            kwargs['project'] = self.minimal
-        elif 'project' in self:
+
+        # Set the project; each class knows how at definition time, so
+        # there is no per-creation type check.
+        self._set_child_project(kwargs)
+
+    def _set_child_project(self, kwargs):
+        if 'project' in self:
             kwargs['project'] = self['project'].copy()
-        
+
     def __init__(self, fixture, parent, data):
         super(_Entity, self).__init__(data)
         self.fixture = fixture
@@ -188,6 +222,7 @@ class _Entity(dict):
         return dict(type=self['type'], id=self['id'])
 
 
+@_register_entity
 class _Project(_Entity):
     _argument_defaults = [('name', _required)]
     _backrefs = {
@@ -195,37 +230,34 @@ class _Project(_Entity):
         'Asset': 'project',
     }
 
+    def _set_child_project(self, kwargs):
+        # We are the project.
+        kwargs['project'] = self.minimal
+
+@_register_entity
 class _Sequence(_Entity):
     _argument_defaults = [('code', _required)]
     _parent = 'project'
     _backrefs = {'Shot': 'sg_sequence'}
 
+@_register_entity
 class _Shot(_Entity):
     _argument_defaults = [('code', _required)]
     _parent = 'sg_sequence'
     _backrefs = {'Task': 'entity'}
 
+@_register_entity
 class _Task(_Entity):
     _argument_defaults = [('content', _required), ('step', _required)]
     _parent = 'entity'
 
+@_register_entity
 class _Step(_Entity):
     _argument_defaults = [('short_name', _required)]
 
+@_register_entity
 class _Asset(_Entity):
     _argument_defaults = [('code', _required), ('sg_asset_type', 'Generic')]
     _parent = 'project'
     _backrefs = {'Task': 'entity'}
 
-
-
-_entity_types = dict(
-    (name[1:], value)
-    for name, value in globals().items()
-    if isinstance(value, type) and issubclass(value, _Entity)
-)
-
-
-
-
-
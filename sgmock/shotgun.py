@@ -11,11 +11,21 @@ import shotgun_api3
 
 from ._vendor.six import string_types
 from .exceptions import ShotgunError, Fault
-from .filters import filter_entities
+from .filters import And, InFilter, IsFilter, compile_cached, filter_entities_take
 from . import events
 from .utils import is_entity, minimize
 
 _no_arg_sentinel = object()
+_unindexable = object()
+
+# Isoformat date/datetime strings (including trailing Z) as written by
+# Shotgun.sgmock_json_dump.
+_iso_date_re = re.compile(
+    # Date
+    r'(\d{4})-(\d{2})-(\d{2})'
+    # Time
+    r'(?:T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{6}))?Z)?'
+)
 
 
 log = logging.getLogger('sgmock')
@@ -53,6 +63,10 @@ class Shotgun(object):
         self._ids = collections.defaultdict(int)
         self._deleted = collections.defaultdict(dict)
 
+        # Secondary index over commonly filtered fields:
+        # (entity_type, field) -> value key -> {id: entity}.
+        self._index = collections.defaultdict(dict)
+
         #self._creator = None
         #self._creator = self.create('HumanUser', {'name': 'TheCreator'})
 
@@ -73,6 +87,88 @@ class Shotgun(object):
             }
         }
 
+    # Fields commonly used in equality filters; `is`/`in` queries on these
+    # are served from the secondary index instead of a full type scan.
+    _indexed_fields = frozenset(('code', 'short_name', 'name', 'sg_asset_type', 'project', 'entity'))
+
+    @staticmethod
+    def _index_key(value):
+        """Map a field or filter value to its index bucket key.
+
+        Datetimes are keyed by the same string form that ``match_types``
+        coerces them to, so string and datetime lookups land in the same
+        bucket; entity links are keyed by their (type, id).
+
+        """
+        if isinstance(value, datetime.datetime):
+            return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+        if is_entity(value):
+            return (value['type'], value['id'])
+        try:
+            hash(value)
+        except TypeError:
+            return _unindexable
+        return value
+
+    def _index_add(self, entity):
+        for field in self._indexed_fields.intersection(entity):
+            key = self._index_key(entity[field])
+            if key is not _unindexable:
+                by_value = self._index[(entity['type'], field)]
+                by_value.setdefault(key, {})[entity['id']] = entity
+
+    def _index_remove(self, entity):
+        for field in self._indexed_fields.intersection(entity):
+            key = self._index_key(entity[field])
+            if key is _unindexable:
+                continue
+            by_value = self._index.get((entity['type'], field))
+            bucket = by_value.get(key) if by_value else None
+            if bucket:
+                bucket.pop(entity['id'], None)
+
+    def _indexed_candidates(self, entity_type, node):
+        """Return entities matching an indexed condition, or None to scan.
+
+        Looks for a leading `is`/`in` condition on an indexed field and
+        serves its bucket(s) from the index; the full compiled predicate
+        still runs over the candidates afterwards, so a superset is fine.
+
+        """
+        children = node.children if type(node) is And else [node]
+        for child in children:
+
+            if type(child) is IsFilter and child.field in self._indexed_fields:
+                if child.value is None:
+                    # None also matches entities missing the field entirely,
+                    # which the index can't see.
+                    continue
+                key = self._index_key(child.value)
+                if key is _unindexable:
+                    continue
+                by_value = self._index.get((entity_type, child.field))
+                bucket = by_value.get(key) if by_value else None
+                if not bucket:
+                    return []
+                # Sorted by id so updates that reshuffle a bucket don't
+                # change the result order.
+                return [bucket[id_] for id_ in sorted(bucket)]
+
+            if type(child) is InFilter and child.field in self._indexed_fields:
+                # `in` does no datetime coercion, so datetime values can't
+                # use the string-keyed buckets; None matches missing fields.
+                if any(v is None or isinstance(v, datetime.datetime) for v in child.values):
+                    continue
+                by_value = self._index.get((entity_type, child.field))
+                merged = {}
+                for value in child.values:
+                    bucket = by_value.get(self._index_key(value)) if by_value else None
+                    if bucket:
+                        merged.update(bucket)
+                return [merged[id_] for id_ in sorted(merged)]
+
+        return None
+
     def _entity_exists(self, entity):
         """Return True if the referenced entity does exist in our store."""
         try:
@@ -82,16 +178,95 @@ class Shotgun(object):
 
     def _minimal_copy(self, entity, fields=None):
         """Get a minimal representation of the given entity; only type and id."""
+        return self._minimal_copy_planned(entity, self._plan_fields(fields))
+
+    # Plan markers for fields that don't parse as a deep-link.
+    _SIMPLE = None
+    _DEEP_MISS = False
+
+    def _plan_fields(self, fields):
+        """Parse return fields into a resolution plan.
+
+        Each entry is ``(field, local, link_type, deep_field)``; ``local``
+        is :attr:`_SIMPLE` for plain fields and :attr:`_DEEP_MISS` for
+        dotted fields that don't resolve as deep-links. Parsing once per
+        query keeps the string splitting out of the per-row loop.
+
+        """
+        plan = []
+        for field in fields or ():
+
+            # The minimal copy always carries these.
+            if field in ('type', 'id'):
+                continue
+
+            # A deep-link is three dot-separated tokens, e.g.
+            # `entity.Shot.code`; anything past the third token is ignored,
+            # so `entity.Shot.code.more` is the same as `entity.Shot.code`.
+            # Plain string ops here beat the regex this used to be.
+            local, sep, rest = field.partition('.')
+            if sep:
+                link_type, sep, deep_field = rest.partition('.')
+                deep_field = deep_field.partition('.')[0]
+                if sep and deep_field and local.isidentifier() and link_type.isidentifier():
+                    plan.append((field, local, link_type, deep_field))
+                    continue
+
+            parts = field.split('.')
+            if any(not x for x in parts):
+                raise ShotgunError('malformed field %r' % field)
+            # Anything that looks kinda like a deep-link returns None;
+            # single fields are simply looked up.
+            local = self._DEEP_MISS if len(parts) > 1 else self._SIMPLE
+            plan.append((field, local, None, None))
+        return plan
+
+    _name_plan = [('name', _SIMPLE, None, None)]
+
+    def _minimal_copy_planned(self, entity, plan, link_cache=None):
         if not entity:
             return
         minimal = minimize(entity)
-        for field in fields or ():
+        for field, local, link_type, deep_field in plan:
+
+            # Simple fields (and literal dotted keys) win outright.
             try:
-                v = self._lookup_field(entity, field)
+                v = entity[field]
             except KeyError:
-                continue
+                if local is self._SIMPLE:
+                    continue
+                if local is self._DEEP_MISS:
+                    minimal[field] = None
+                    continue
+
+                # Get the link; non-existant local parts of a deep link
+                # and non-entity deep-links are ignored.
+                link = entity.get(local)
+                if not isinstance(link, dict) or 'type' not in link:
+                    continue
+
+                # Deep-link type mismatches result in a None.
+                if not link['type'] == link_type:
+                    minimal[field] = None
+                    continue
+
+                # Resolve the link, but let the error pop through since
+                # Shotgun would never actually get to this state. There is
+                # only one level of a deep-link.
+                v = self._resolve_link(link).get(deep_field)
+
             if is_entity(v):
-                minimal[field] = self._minimal_copy(self._resolve_link(v), ['name'])
+                if link_cache is None:
+                    minimal[field] = self._minimal_copy_planned(self._resolve_link(v), self._name_plan)
+                else:
+                    # Rows in one query mostly share the same few links
+                    # (project, sequence, ...); resolve each just once.
+                    key = (v['type'], v['id'])
+                    try:
+                        minimal[field] = link_cache[key]
+                    except KeyError:
+                        minimal[field] = link_cache[key] = self._minimal_copy_planned(
+                            self._resolve_link(v), self._name_plan)
             elif isinstance(v, list):
                 res = []
                 for x in v:
@@ -114,57 +289,6 @@ class Shotgun(object):
         return self._store[type_].get(id_) or self._deleted[type_].get(id_)
 
 
-    # `entity.Shot.code.more` will return same as `entity.Shot.code`.
-    _deep_lookup_re = re.compile(r'^(\w+)\.(\w+)\.([^.]+)')
-
-    def _lookup_field(self, entity, field):
-
-        if not entity:
-            return
-
-        # Simple fields.
-        try:
-            return entity[field]
-        except KeyError:
-            pass
-
-        m = self._deep_lookup_re.match(field)
-        if not m:
-
-            parts = field.split('.')
-            if any(not x for x in parts):
-                raise ShotgunError('malformed field %r' % field)
-
-            # Anything that looks kinda like a deep-link returns None.
-            if len(parts) > 1:
-                return None
-
-            # Single fields are ignored.
-            raise KeyError(field)
-
-        local_field, link_type, deep_field = m.groups()
-        # Get the link.
-        try:
-            link = entity[local_field]
-        except KeyError:
-            # Non existant local parts of a deep link are ignored.
-            raise KeyError(field)
-
-        # Non-entity deep-links are ignored.
-        if not isinstance(link, dict):
-            raise KeyError(field)
-
-        # Deep-link type mismatches result in a None
-        if not link['type'] == link_type:
-            return None
-
-        # Resolve the link, but let the error pop through since Shotgun would
-        # never actually get to this state.
-        linked = self._resolve_link(link)
-
-        # There is only one level of a deep-link, and it always returns None.
-        return linked.get(deep_field)
-
     def _reduce_links(self, data):
         if isinstance(data, dict):
             if 'type' in data and 'id' in data:
@@ -214,10 +338,13 @@ class Shotgun(object):
         entity['updated_at'] = datetime.datetime.utcnow()
         #entity['updated_by'] = self._creator
 
-        # Reduce all links to the basic forms.
-        data = dict(data)
-        data.pop('id', None)
-        entity.update(self._reduce_links(data))
+        # Reduce all links to the basic forms, keeping the index in step.
+        # Reducing value by value saves copying the caller's dict just to
+        # pop 'id' and then copying it again in _reduce_links.
+        self._index_remove(entity)
+        entity.update(
+            (k, self._reduce_links(v)) for k, v in data.items() if k != 'id')
+        self._index_add(entity)
 
         return entity
 
@@ -236,7 +363,11 @@ class Shotgun(object):
             log.info('create(%r, %r) -> %d' % (entity_type, data, entity['id']))
         if _generate_events and self._generate_events:
             events.generate_for_create(self, entity)
-        return self._minimal_copy(entity, itertools.chain(data.iterkeys(), return_fields or ()))
+        # Deduplicate; data and return_fields often overlap, and each field
+        # costs a lookup in _minimal_copy.
+        fields = set(data)
+        fields.update(return_fields or ())
+        return self._minimal_copy(entity, fields)
 
     def update(self, entity_type, entity_id, data, _generate_events=True):
 
@@ -290,22 +421,34 @@ class Shotgun(object):
 
         """
 
-        store = self._deleted if retired_only else self._store
-        entities = store[entity_type].values()
-        entities = filter_entities(filters, entities)
+        node, predicate = compile_cached(filters)
 
-        # Very rough paging.
+        entities = None
+        if retired_only:
+            entities = self._deleted[entity_type].values()
+        else:
+            # Serve an indexed equality condition from the secondary index
+            # where we can; fall back to scanning the whole type.
+            entities = self._indexed_candidates(entity_type, node)
+            if entities is None:
+                entities = self._store[entity_type].values()
+
+        # Very rough paging; stop scanning once the page is full, so e.g.
+        # find_one never tests the filter past its first hit.
         limit = max(1, min(500, limit))
         start = max(0, page - 1) * limit
-        entities = itertools.islice(entities, start, start + limit)
-
-        # Return minimal copies.
-        res = []
-        for entity in entities:
-            entity = self._minimal_copy(entity, fields)
-            res.append(entity)
-
-        log.info('find(%r, %r) -> [%s]' % (entity_type, filters, ', '.join(str(e['id']) for e in res)))
+        entities = filter_entities_take(filters, entities, start + limit, predicate)[start:]
+
+        # Return minimal copies, resolving the return fields with one
+        # shared plan rather than re-parsing them per row. The bound local
+        # saves a LOAD_ATTR per row.
+        plan = self._plan_fields(fields)
+        link_cache = {}
+        _copy = self._minimal_copy_planned
+        res = [_copy(entity, plan, link_cache) for entity in entities]
+
+        if log.isEnabledFor(logging.INFO):
+            log.info('find(%r, %r) -> [%s]' % (entity_type, filters, ', '.join(str(e['id']) for e in res)))
         return res
 
     _batch_type_args = {
@@ -366,6 +509,7 @@ class Shotgun(object):
 
         entity = self._store[entity_type].pop(entity_id, None)
         if entity:
+            self._index_remove(entity)
             self._deleted[entity_type][entity_id] = entity
             if _generate_events and self._generate_events:
                 events.generate_for_delete(self, entity)
@@ -376,6 +520,7 @@ class Shotgun(object):
         entity = self._deleted[entity_type].pop(entity_id, None)
         if entity:
             self._store[entity_type][entity_id] = entity
+            self._index_add(entity)
             if _generate_events and self._generate_events:
                 events.generate_for_revive(self, entity)
         log.info('revive(%r, %r) -> %r' % (entity_type, entity_id, bool(entity)))
@@ -384,6 +529,7 @@ class Shotgun(object):
     def clear(self):
         self._store.clear()
         self._deleted.clear()
+        self._index.clear()
 
     def sgmock_json_dump(self, *args, **kwargs):
         """ Saves the current state of the db to json.
@@ -426,7 +572,8 @@ class Shotgun(object):
         for entity_type, entities in objects.items():
             # json keys must be strings.
             ids = set()
-            for sid in entities.keys():
+            # List the keys up front; we re-key the dict as we go.
+            for sid in list(entities.keys()):
                 # Convert the string id from json to the expected int value
                 entity_id = int(sid)
                 ids.add(entity_id)
@@ -434,32 +581,22 @@ class Shotgun(object):
 
                 for field in entities[entity_id]:
                     value = entities[entity_id][field]
-                    if isinstance(value, string_types):
-                        # Convert isoformat datestrings to dattime objects
-                        pattern = (
-                            # Date
-                            '(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})'
-                            # Time
-                            '(?:T(?P<hour>\d{2}):(?P<minute>\d{2}):'
-                            '(?P<second>\d{2})(?:.(?P<microsecond>\d{6}))?Z)?'
-                        )
-                        match = re.match(pattern, value)
+                    # Convert isoformat datestrings to datetime objects; the
+                    # cheap digit guard skips the regex on ordinary strings.
+                    if isinstance(value, string_types) and value[:4].isdigit():
+                        match = _iso_date_re.match(value)
                         if match:
-                            groupdict = match.groupdict()
-                            if groupdict['hour'] is None:
+                            g = match.groups()
+                            if g[3] is None:
                                 # It's a date object
-                                createClass = datetime.date
-                                groupdict.pop('hour')
-                                groupdict.pop('minute')
-                                groupdict.pop('second')
-                                groupdict.pop('microsecond')
+                                entities[entity_id][field] = datetime.date(
+                                    int(g[0]), int(g[1]), int(g[2]))
                             else:
                                 # its a datetime object
-                                createClass = datetime.datetime
-
-                            entities[entity_id][field] = createClass(
-                                **{k: int(v) for k, v in groupdict.items()}
-                            )
+                                entities[entity_id][field] = datetime.datetime(
+                                    int(g[0]), int(g[1]), int(g[2]),
+                                    int(g[3]), int(g[4]), int(g[5]),
+                                    int(g[6]) if g[6] else 0)
 
             # Store the largest entity id so the index is correct.
             if ids:
@@ -470,3 +607,8 @@ class Shotgun(object):
         self._ids = entity_ids
         # clear the other container variables so we start fresh
         self._deleted = collections.defaultdict(dict)
+        # Rebuild the secondary index over the loaded entities.
+        self._index = collections.defaultdict(dict)
+        for entities in objects.values():
+            for entity in entities.values():
+                self._index_add(entity)
@@ -13,7 +13,7 @@ class TestBatch(TestCase):
             request_type='create',
             entity_type=type_,
             data=dict(i=i),
-        ) for i in xrange(count)])
+        ) for i in range(count)])
         
         self.assertEqual(len(result), count)
         for entity in result:
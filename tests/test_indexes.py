@@ -0,0 +1,42 @@
+from .common import *
+
+
+class TestIndexes(TestCase):
+
+    def test_find_after_update(self):
+        sg = Shotgun()
+        a = sg.create('Shot', {'code': 'A'})
+        b = sg.create('Shot', {'code': 'B'})
+
+        sg.update('Shot', a['id'], {'code': 'B'})
+        found = sg.find('Shot', [('code', 'is', 'B')])
+        self.assertEqual(len(found), 2)
+        self.assertEqual(sg.find('Shot', [('code', 'is', 'A')]), [])
+
+    def test_find_after_delete_and_revive(self):
+        sg = Shotgun()
+        a = sg.create('Shot', {'code': 'A'})
+
+        sg.delete('Shot', a['id'])
+        self.assertEqual(sg.find('Shot', [('code', 'is', 'A')]), [])
+
+        sg.revive('Shot', a['id'])
+        self.assertSameEntity(a, sg.find_one('Shot', [('code', 'is', 'A')]))
+
+    def test_find_in_on_indexed_field(self):
+        sg = Shotgun()
+        a = sg.create('Shot', {'code': 'A'})
+        b = sg.create('Shot', {'code': 'B'})
+        c = sg.create('Shot', {'code': 'C'})
+
+        found = sg.find('Shot', [('code', 'in', ['A', 'C'])])
+        self.assertEqual(len(found), 2)
+        self.assertSameEntity(a, found[0])
+        self.assertSameEntity(c, found[1])
+
+    def test_find_missing_field_with_none(self):
+        sg = Shotgun()
+        a = sg.create('Shot', {'code': 'A'})
+
+        # None also matches entities that don't have the field at all.
+        self.assertSameEntity(a, sg.find_one('Shot', [('name', 'is', None)]))
@@ -1,9 +1,12 @@
 import json
 import shutil
 import tempfile
-import datetime
 from .common import *
 
+# After the star import, which shadows the module with the class from
+# `common`'s `from datetime import datetime`.
+import datetime
+
 type_ = 'Dummy' + mini_uuid().upper()
 
 class TestJsonDbSource(TestCase):
@@ -55,7 +58,7 @@ class TestJsonDbSource(TestCase):
         # Validate that our source db is setup as expected
         validateDatabase(sgSource)
 
-        with tempfile.TemporaryFile(prefix='sgmock_') as fp:
+        with tempfile.TemporaryFile(mode='w+', prefix='sgmock_') as fp:
             # Save the source db to disk.
             sgSource.sgmock_json_dump(fp, indent=4)
 